@@ -1,28 +1,77 @@
 
+import asyncio
+import functools
+import hmac
+import itertools
 import json
 import os
-
-from typing import Union, Dict, List, Tuple, Optional, Mapping, NamedTuple, Set, Iterable
-
-from fastapi import FastAPI, Response, status, Header
-from fastapi.responses import JSONResponse
+import re
+import threading
+import time
+import weakref
+
+from collections import OrderedDict
+from typing import Union, Dict, List, Tuple, Optional, Mapping, NamedTuple, Set, Iterable, FrozenSet, Callable, TypeVar
+
+from fastapi import FastAPI, Request, Response, status, Header, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, ORJSONResponse
+import orjson
 from pydantic import BaseModel
-from sqlalchemy import create_engine, inspect, select, schema, func, within_group
+from sqlalchemy import create_engine, inspect, select, schema, func, within_group, bindparam, Float, text
 from sqlalchemy.engine import reflection
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import InvalidRequestError, NoSuchTableError
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.util import LRUCache
 from dotenv import load_dotenv
 
 load_dotenv()
 
+T = TypeVar("T")
+
 try:
     API_TOKEN = os.environ["API_TOKEN"]
 except KeyError:
     raise Exception("No API_TOKEN provided as environment variable") from None
 
+_API_TOKEN_BYTES = API_TOKEN.encode()
+
 
 MEAN_DIFF_THRESHOLD = 5  # percent
 STDDEV_DIFF_THRESHOLD = 5  # percent
 IQR_DIFF_THRESHOLD = 10  # percent
 
+# Lowercased type names, as produced by str(column.type) without the "(...)" part
+NUMERIC_TYPES = frozenset({
+    "float", "real", "double precision",
+    "integer", "bigint", "smallint",
+    "numeric", "decimal",
+})
+TEXT_TYPES = frozenset({
+    "char", "varchar", "text", "character varying",
+    "nchar", "nvarchar",
+})
+
+# Fallbacks for dialect spellings outside the sets above, e.g. "integer unsigned"
+_NUMERIC_TYPE_RE = re.compile(
+    r"\b(?:float|real|double precision|integer|bigint|smallint|numeric|decimal)\b"
+)
+_TEXT_TYPE_RE = re.compile(r"\b(?:n?char|n?varchar|text|character varying)\b")
+
+AVAILABLE_METRICS_JSON = orjson.dumps(["mean", "stddev", "quartiles", "row_count"])
+
+REFLECTION_CACHE_TTL = 300  # seconds
+REFLECTION_CACHE_SIZE = 256  # tables
+
+DB_POOL_SIZE = 10
+DB_MAX_OVERFLOW = 20
+# Connections older than this are replaced at checkout, before typical server
+# side idle timeouts. Connections killed any other way are caught by pre-ping.
+DB_POOL_RECYCLE = 1800  # seconds
+# Engines (each with its own pool) kept for reuse, least recently used go first
+MAX_CACHED_ENGINES = 32
+
 DIFF_THRESHOLD_MAP = {
     "mean_diff": MEAN_DIFF_THRESHOLD,
     'stddev_diff': STDDEV_DIFF_THRESHOLD,
@@ -37,103 +86,307 @@ class DiffInput(BaseModel):
     conn_2: str
     table_1: str
     table_2: str
+    # Estimate the column metrics and row counts from a TABLESAMPLE SYSTEM
+    # sample of this percentage of each table (PostgreSQL only).
+    sample_percent: Optional[float] = None
+
+
+
+class _ORJSONResponse(ORJSONResponse):
+
+    # Reflected column names are sqlalchemy quoted_name (a str subclass),
+    # which orjson only accepts as dict keys with OPT_NON_STR_KEYS.
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+# The diff payloads are large nested dicts, orjson encodes them in one C call
+app = FastAPI(default_response_class=_ORJSONResponse)
+
+# Engines are reused across requests so their connection pools are too
+_engines: "OrderedDict[str, sqlalchemy.Engine]" = OrderedDict()
+
+# Bounds the blocking DB calls in flight per engine, see _run_db_call
+_db_semaphores: "weakref.WeakKeyDictionary[sqlalchemy.Engine, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+# Reflected tables, each in a MetaData of its own,
+# {("db_url", "table_name"): (Table, time.monotonic() of the reflection)}
+_table_cache = LRUCache(REFLECTION_CACHE_SIZE)
+# Only held to read or swap cache entries, never across a DB round trip
+_metadata_lock = threading.Lock()
+# Engines dropped from _engines, requests still using them don't cache reflections
+_evicted_engines: "weakref.WeakSet[sqlalchemy.Engine]" = weakref.WeakSet()
+
+# Compiled SQL of the metrics statements, keyed by dialect and statement
+_compiled_cache = LRUCache(256)
+
+
+class AuthenticationError(Exception):
+    pass
+
+
+@app.exception_handler(AuthenticationError)
+async def authentication_error_handler(request: Request, exc: AuthenticationError):
+    return JSONResponse(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        content={"error": "Authentication failure"}
+    )
 
 
+async def verify_token(x_api_token: str = Header("")) -> None: # X-API-TOKEN
+    # Constant time compare, doesn't leak how much of the token matched
+    if not hmac.compare_digest(x_api_token.encode(), _API_TOKEN_BYTES):
+        raise AuthenticationError()
 
-app = FastAPI()
 
+def _get_pool_options(connection_string: str) -> Dict[str, int]:
+    url = make_url(connection_string)
+    pool_options = {"pool_recycle": DB_POOL_RECYCLE}
+
+    # Dialects that default to another pool (e.g. SQLite's NullPool) reject the sizing arguments
+    if issubclass(url.get_dialect().get_pool_class(url), QueuePool):
+        pool_options["pool_size"] = DB_POOL_SIZE
+        pool_options["max_overflow"] = DB_MAX_OVERFLOW
+
+    return pool_options
+
+def _dispose_engine(engine: "sqlalchemy.Engine") -> None:
+    engine.dispose()
+
+    # Tables reflected through this engine go with it. Marked under the same
+    # lock as the purge, so an in-flight reflection can't write back after it.
+    db_url = str(engine.url)
+    with _metadata_lock:
+        _evicted_engines.add(engine)
+        for key in [key for key in _table_cache if key[0] == db_url]:
+            _table_cache.pop(key, None)
 
 async def connect_database(connection_string: str) -> "sqlalchemy.Engine":
+    # No await between the lookup and the insert below, so concurrent
+    # requests can't race each other into creating duplicate engines.
+    engine = _engines.get(connection_string)
+    if engine is not None:
+        _engines.move_to_end(connection_string)
+        return engine
+
     try:
-        engine = create_engine(connection_string)
+        # pre-ping swaps out connections the server has closed (restart,
+        # terminated backend), the queries below would fail on them otherwise
+        pool_options = _get_pool_options(connection_string)
+        engine = create_engine(
+            connection_string,
+            pool_pre_ping=True,
+            **pool_options
+        )
     except Exception:
         return None
+
+    _engines[connection_string] = engine
+    # Sized to this engine's pool, a slow database only queues its own calls
+    _db_semaphores[engine] = asyncio.Semaphore(
+        pool_options.get("pool_size", DB_POOL_SIZE)
+        + pool_options.get("max_overflow", DB_MAX_OVERFLOW)
+    )
+
+    # Connection strings come from the client, so the cache has to be bounded
+    if len(_engines) > MAX_CACHED_ENGINES:
+        _, evicted_engine = _engines.popitem(last=False)
+        await run_in_threadpool(_dispose_engine, evicted_engine)
+
     return engine
 
-async def table_name_exists(engine: "Engine", table_name: str) -> bool:
+@app.on_event("shutdown")
+async def dispose_engines():
+    # Close pooled connections instead of leaving them for the DB to time out
+    for engine in _engines.values():
+        engine.dispose()
+    _engines.clear()
 
-    metadata = schema.MetaData()
+# SQLAlchemy engines are blocking, so every DB round trip below runs in the
+# threadpool to keep the event loop free for other requests.
 
+async def _run_db_call(
+        fn: Callable[..., T], engine: "sqlalchemy.Engine", *args
+    ) -> T:
+
+    # Bursts wait here instead of piling up on the engine's pool timeout
+    async with _db_semaphores[engine]:
+        return await run_in_threadpool(fn, engine, *args)
+
+def _table_name_exists(engine: "Engine", table_name: str) -> bool:
+
+    # Always asked of the DB, a cached reflection can outlive a dropped table.
+    # Targeted catalog lookup, no need to list or reflect every table
     try:
-        metadata.reflect(bind=engine, only=[table_name])
+        exists = engine.has_table(table_name)
     except Exception:
         return False
 
-    return table_name in metadata.tables
+    if not exists:
+        # Don't serve the dropped table's columns if it comes back before the TTL
+        with _metadata_lock:
+            _table_cache.pop((str(engine.url), table_name), None)
 
-async def get_table_columns(
+    return exists
+
+async def table_name_exists(engine: "Engine", table_name: str) -> bool:
+    return await _run_db_call(_table_name_exists, engine, table_name)
+
+def _reflect_table(
     engine: "sqlalchemy.Engine", table_name: str
     ) -> Tuple[Union["sqlalchemy.Table", List["sqlalchemy.Column"]]]:
 
-    metadata = schema.MetaData()
-    metadata.reflect(bind=engine, only=[table_name])
+    key = (str(engine.url), table_name)
+
+    # Only hit the DB catalog when a table is missing or its reflection is
+    # older than REFLECTION_CACHE_TTL.
+    with _metadata_lock:
+        cached = _table_cache.get(key)
+        if cached is not None:
+            table, reflected_at = cached
+            if time.monotonic() - reflected_at <= REFLECTION_CACHE_TTL:
+                return table, table.columns
+            # Stale entries go now, a table that isn't asked for again won't linger
+            _table_cache.pop(key, None)
 
-    table = metadata.tables[table_name]  # metadata.tables = {"table_name": "reflected_table_object"}
+    # Reflected outside the lock into a fresh MetaData, so a slow catalog only
+    # delays requests for this table and nobody sees it half reflected.
+    # Reflects just this table, MetaData.reflect() would list every table first.
+    table = schema.Table(table_name, schema.MetaData(), autoload_with=engine)
+
+    with _metadata_lock:
+        if engine not in _evicted_engines:
+            _table_cache[key] = (table, time.monotonic())
 
     return table, table.columns
 
+async def get_table_columns(
+    engine: "sqlalchemy.Engine", table_name: str
+    ) -> Tuple[Union["sqlalchemy.Table", List["sqlalchemy.Column"]]]:
+
+    # Returns (None, None) when there is no table to reflect. has_table also
+    # matches sequences and indexes, and the table can be dropped in between.
+    try:
+        return await _run_db_call(_reflect_table, engine, table_name)
+    except (NoSuchTableError, InvalidRequestError):
+        return None, None
+
+def _supports_tablesample(engine: "sqlalchemy.Engine", table_name: str) -> bool:
+
+    # TABLESAMPLE works on tables, partitioned tables and materialized views,
+    # but not on views. quote_ident matches the exact name like has_table does.
+    statement = text(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass(quote_ident(:table_name))"
+    )
+    with engine.connect() as connection:
+        relkind = connection.execute(statement, table_name=table_name).scalar()
+
+    return relkind in ("r", "p", "m")
+
+async def supports_tablesample(engine: "sqlalchemy.Engine", table_name: str) -> bool:
+    return await _run_db_call(_supports_tablesample, engine, table_name)
+
+def _run_metrics_query(
+    engine: "sqlalchemy.Engine", 
+    statement: "sqlalchemy.sql.Select", 
+    count_statement: "sqlalchemy.sql.Select", 
+    params: Dict[str, float]
+    ) -> Dict[str, float]:
+
+    with engine.connect() as connection:
+        connection = connection.execution_options(compiled_cache=_compiled_cache)
+        try:
+            row = connection.execute(statement, params).first()
+        except Exception:
+            # A failing aggregate (e.g. stddev overflowing) only costs the
+            # column metrics, the row count is still fetched on its own.
+            row = connection.execute(count_statement, params).first()
+
+    return dict(row) if row is not None else {}
+
 async def get_table_metrics(
     engine: "sqlalchemy.Engine", 
-    mean_stddev_pairs: List[Tuple], 
-    table_name: str
+    statement: "sqlalchemy.sql.Select", 
+    count_statement: "sqlalchemy.sql.Select", 
+    numeric_columns: Iterable[str],
+    sample_percent: Optional[float] = None
     ) -> Dict[str, Dict[str, float]]:
-     
-    select_query = [
-        element
-        for pair in mean_stddev_pairs
-        for element in pair
-    ]
-    
-    statement = select(select_query) 
 
-    connection = engine.connect()
+    params = {} if sample_percent is None else {"sample_percent": sample_percent}
 
-    
-    try:
-        
-        agg_result = dict(next(connection.execute(statement)))
-    except Exception:
-        agg_result = {}
-    
-    
-    agg_result = {
-        key: round(float(value), 2) for key, value in agg_result.items()
-    } #{'avg_rent_sqft_mean': 1.48526457913677,
+    row = await _run_db_call(
+        _run_metrics_query, engine, statement, count_statement, params
+    )
+    row_count = row.pop("row_count", 0)
+    if sample_percent is not None:
+        # Estimate for the whole table, a full count(*) would scan every row
+        row_count = round(row_count * 100 / sample_percent)
+
+    # Fixed shape, every aggregate key is present even without numeric columns
+    formatted_metrics = {
+        "row_count": row_count,
+        "mean": {},
+        "stddev": {},
+        "quartile25": {},
+        "quartile50": {},
+        "quartile75": {},
+        "quartile100": {},
+        "IQR": {},
+    }
 
+    agg_result = {}  # {'avg_rent_sqft_mean': 1.49, ...}
 
-    
-    quartile_map = {}
+    for column_agg, value in row.items():
+        # Aggregates over an empty table (or all NULL column) come back as None
+        if value is None:
+            continue
 
-    for key, value in agg_result.items():
-        if key.endswith("quartile25") or key.endswith("quartile75"):
-            column_name, sep, quartile = key.rpartition("_")
-            # ("nr_floors", "_", "quartile25")
+        value = round(float(value), 2)
+        agg_result[column_agg] = value
 
-            quartile_map.setdefault(column_name, {}).update({quartile: value})
-    
-    for column_name, quartile_data in quartile_map.items():
-        agg_result[f"{column_name}_IQR"] = quartile_data["quartile75"] - quartile_data["quartile25"]
+        column_name, _, agg = column_agg.rpartition("_") # "column_1_mean" -> ("column_1", "_", "mean")
+        formatted_metrics[agg][column_name] = value
+
+    # IQR needs both quartiles, so it is filled in once the row has been read.
+    # Missing (NULL) quartiles were skipped above and leave no IQR either.
+    for column_name in numeric_columns:
+        quartile75 = agg_result.get(f"{column_name}_quartile75")
+        quartile25 = agg_result.get(f"{column_name}_quartile25")
+        if quartile75 is not None and quartile25 is not None:
+            iqr = quartile75 - quartile25
+            agg_result[f"{column_name}_IQR"] = iqr
+            formatted_metrics["IQR"][column_name] = iqr
 
+    return {"metrics": formatted_metrics, "original_metrics": agg_result}
 
-    
-    try:
-        row_count = next(connection.execute(f"select count(*) from {table_name}"))[0]
-    except Exception:
-        row_count = 0
 
-    
-    formatted_metrics = {"row_count": row_count}
+# Type names come from a small vocabulary, so each one is classified only once
+@functools.lru_cache(maxsize=1024)
+def _is_numeric_type(col_type: str) -> bool:
+    if col_type in NUMERIC_TYPES:
+        return True
+    # arrays of numbers, e.g. "double precision[]", can't be aggregated
+    return not col_type.endswith("[]") and bool(_NUMERIC_TYPE_RE.search(col_type))
 
-    
-    for column_agg, value in agg_result.items():
-        column_name, _, agg = column_agg.rpartition("_") # "column_1_mean" -> ("column_1", "_", "mean")
-        if agg in formatted_metrics:
-            formatted_metrics[agg][column_name] = value
-        else:
-            formatted_metrics[agg] = {}
-            formatted_metrics[agg][column_name] = value
+@functools.lru_cache(maxsize=1024)
+def _is_text_type(col_type: str) -> bool:
+    if col_type in TEXT_TYPES:
+        return True
+    return not col_type.endswith("[]") and bool(_TEXT_TYPE_RE.search(col_type))
 
-    return {"metrics": formatted_metrics, "original_metrics": agg_result}
+
+def _get_column_type(column: "sqlalchemy.Column") -> str:
+
+    # str(column.type) compiles the type through a dialect. Reflected columns
+    # are cached, so keep the result in the column's own info dict.
+    col_type = column.info.get("type_name")
+    if col_type is None:
+        col_type = str(column.type).partition("(")[0]  # "VARCHAR(10)".partition("(") -> ("VARCHAR", "(", "10)")[0] -> "VARCHAR"
+        column.info["type_name"] = col_type
+
+    return col_type
 
 
 async def get_all_columns_info(
@@ -141,19 +394,19 @@ async def get_all_columns_info(
     ) -> Dict[str, Union[List[str], Dict[str, "ColumnType"]]]:
 
     col_name_type = {}  # {"col_1": "text", "col_2": "float"}
-    numeric_cols = set()
+    numeric_cols = []
 
     for col_name, meta in table_columns.items():
-        col_type = str(meta.type).partition("(")[0]  # "varchar(10)".partition("(") -> ("varchar", "(", "10)")[0] -> "varchar"
+        col_type = _get_column_type(meta)
         
-        col_type = col_type.casefold()
+        col_type = col_type.lower()
         col_name_type[col_name] = col_type
-        if "float" in col_type or "integer" in col_type or "precision" in col_type:
-            numeric_cols.add(col_name)
+        if _is_numeric_type(col_type):
+            numeric_cols.append(col_name)
 
     return {
         "columns_type_map": col_name_type,
-        "numeric_columns": list(numeric_cols),
+        "numeric_columns": numeric_cols,
     }
 
 
@@ -162,32 +415,31 @@ async def get_columns_data(
         table_2_cols: Mapping[str, "sqlalchemy.Column"]
     ) -> Dict[str, List[str]]:
 
-    common_cols = set()
+    # {"col_1": "VARCHAR", "col_2": "INTEGER"}, resolved once per column
+    table_1_types = {col_name: _get_column_type(meta) for col_name, meta in table_1_cols.items()}
+    table_2_types = {col_name: _get_column_type(meta) for col_name, meta in table_2_cols.items()}
 
-    for col_name, meta in table_1_cols.items():
-        try:
-            table_2_cols[col_name]
-        except Exception:
-            pass
-        else:
-            common_cols.add(col_name)
+    # dict key views support set operations directly
+    table_1_col_names = table_1_types.keys()
+    table_2_col_names = table_2_types.keys()
 
-    table_1_uncommon_cols = set(table_1_cols.keys()) - common_cols
-    table_2_uncommon_cols = set(table_2_cols.keys()) - common_cols
+    common_cols = table_1_col_names & table_2_col_names
+    table_1_uncommon_cols = table_1_col_names - common_cols
+    table_2_uncommon_cols = table_2_col_names - common_cols
 
     column_out = {
         "table_1_uncommon_columns": list(table_1_uncommon_cols),
         "table_2_uncommon_columns": list(table_2_uncommon_cols),
         "common_columns": list(common_cols),
-        "common_columns_same_type": [],
+        "common_columns_same_type": {},  # {"col_1": "INTEGER"}
         "common_columns_different_type": [],
     }
 
     for col in common_cols:
-        table_1_col_type = str(table_1_cols[col].type).partition("(")[0]
-        table_2_col_type = str(table_2_cols[col].type).partition("(")[0]
+        table_1_col_type = table_1_types[col]
+        table_2_col_type = table_2_types[col]
         if table_1_col_type == table_2_col_type:
-            column_out["common_columns_same_type"].append({col: table_1_col_type})
+            column_out["common_columns_same_type"][col] = table_1_col_type
         else:
             column_out["common_columns_different_type"].append(
                 {
@@ -200,23 +452,38 @@ async def get_columns_data(
     return column_out
 
 
-@app.get("/api/getAvailableMetrics")
-async def get_available_metrics(
-        x_api_token: str = Header(""),
-    ):
+@app.get("/api/getAvailableMetrics", dependencies=[Depends(verify_token)])
+async def get_available_metrics():
 
-    if x_api_token != API_TOKEN:
-        return JSONResponse(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            content={"error": "Authentication failure"}
-        )
-    
-    return JSONResponse(
+    # Static payload, encoded once at import. The endpoint requires a token,
+    # so only private (client side) caching is allowed.
+    return Response(
         status_code=status.HTTP_200_OK,
-        content=["mean", "stddev", "quartiles", "row_count"]
+        content=AVAILABLE_METRICS_JSON,
+        media_type="application/json",
+        headers={"Cache-Control": "private, max-age=86400"},
     )
 
 
+def _clear_reflection_cache() -> None:
+    with _metadata_lock:
+        _table_cache.clear()
+
+@app.post("/api/invalidateCache", dependencies=[Depends(verify_token)])
+async def invalidate_cache():
+
+    # Drop reflected tables (and the statements built from them) so the next
+    # request picks up schema changes without waiting for the TTL. The lock
+    # may be held by a reflection thread, so don't wait for it on the event loop.
+    await run_in_threadpool(_clear_reflection_cache)
+
+    _get_metrics_statement.cache_clear()
+    _get_count_statement.cache_clear()
+    _compiled_cache.clear()
+
+    return {"status": "Cache invalidated"}
+
+
 class AvailableColumnsInput(BaseModel):
 
     conn_1: str
@@ -251,17 +518,30 @@ async def _get_engines_conns_tables(
 
     return (engine_2, conn_1, conn_2, table_1, table_2)
 
-@app.post("/api/getAvailableColumns")
+async def _get_table_info(
+        conn: str, table_name: str
+    ) -> Tuple[Optional[str], Dict[str, Union[List[str], Dict[str, "ColumnType"]]]]:
+
+    # Returns (error, columns_info), error is None when the table was found
+    engine = await connect_database(conn)
+    if not engine:
+        return "Could not connect to DB with the provided connection string.", {}
+
+    if not await table_name_exists(engine, table_name):
+        return f"Table name {table_name} does not exist.", {}
+
+    _, table_cols = await get_table_columns(engine, table_name)
+    if table_cols is None:
+        return f"Table name {table_name} does not exist.", {}
+
+    return None, await get_all_columns_info(table_cols)
+
+@app.post("/api/getAvailableColumns", dependencies=[Depends(verify_token)])
 async def get_available_columns(
         payload: AvailableColumnsInput,
         response: Response,
-        x_api_token: str = Header("") # X-API-TOKEN
     ):
 
-    if x_api_token != API_TOKEN:
-        response.status_code = status.HTTP_401_UNAUTHORIZED
-        return {"error": "Authentication failure"}
-
     conn_1 = payload.conn_1
     conn_2 = payload.conn_2
     table_1 = payload.table_1
@@ -271,48 +551,24 @@ async def get_available_columns(
         conn_1, conn_2, table_1, table_2
     )
 
-    engine_1 = await connect_database(conn_1)
-    if not engine_1:
-        response.status_code = status.HTTP_400_BAD_REQUEST
-        return {"error": f"Could not connect to DB with the provided connection string."}
-
-    if not await table_name_exists(engine_1, table_1):
-        response.status_code = status.HTTP_400_BAD_REQUEST
-        return {"error": f"Table name {table_1} does not exist."}
-    
+    tables = [(conn_1, table_1)]
     if engine_2:
-        engine_2 = await connect_database(conn_2)
-        if not engine_2:
-            response.status_code = status.HTTP_400_BAD_REQUEST
-            return {"error": f"Could not connect to DB with the provided connection string"}
-  
-        if not await table_name_exists(engine_2, table_2):
-            response.status_code = status.HTTP_400_BAD_REQUEST
-            return {"error": f"Table name {table_2} does not exist."}
+        tables.append((conn_2, table_2))
 
-    if engine_2:
-        output = {
-            "table_1": {}, "table_2": {},
-        }
-    else:
-        output = {
-            "table": {}
-        }
+    # Each table lives behind its own connection, so look them up concurrently
+    tables_info = await asyncio.gather(
+        *(_get_table_info(conn, table) for conn, table in tables)
+    )
 
-    _, table_1_cols = await get_table_columns(engine_1, table_1)
+    for error, _ in tables_info:
+        if error:
+            response.status_code = status.HTTP_400_BAD_REQUEST
+            return {"error": error}
 
-    table_1_info = await get_all_columns_info(table_1_cols)
     if not engine_2:
-        output["table"] = table_1_info
-        return output
+        return {"table": tables_info[0][1]}
 
-    output["table_1"] = table_1_info
-
-    _, table_2_cols = await get_table_columns(engine_2, table_2) 
-    table_2_info = await get_all_columns_info(table_2_cols)
-    output["table_2"] = table_2_info
-
-    return output
+    return {"table_1": tables_info[0][1], "table_2": tables_info[1][1]}
 
 
 class ColumnTypes(NamedTuple):
@@ -321,52 +577,96 @@ class ColumnTypes(NamedTuple):
     numeric_columns: Set[str]
 
 async def _get_numeric_text_cols(
-        common_columns_same_type: List[Mapping[str, "ColumnType"]]
+        common_columns_same_type: Mapping[str, str]
     ) -> ColumnTypes:
 
     numeric_columns = set()
     text_columns = set()
 
     # check for alphanumeric columns, we only want to analyze those for now.
-    for column_data in common_columns_same_type:
-        for column_name, column_type in column_data.items():
-            column_type = column_type.casefold()
-            if (
-                "float" in column_type or
-                "integer" in column_type or
-                "decimal" in column_type or 
-                (
-                    "double precision" in column_type and "[]" not in column_type
-                )
-            ):
-                numeric_columns.add(column_name)
-            elif "char" in column_type or "text" in column_type:
-                text_columns.add(column_name)
+    for column_name, column_type in common_columns_same_type.items():
+        column_type = column_type.lower()
+        if _is_numeric_type(column_type):
+            numeric_columns.add(column_name)
+        elif _is_text_type(column_type):
+            text_columns.add(column_name)
 
     return ColumnTypes(text_columns=text_columns, numeric_columns=numeric_columns)
 
 
+def _get_column_metrics(
+        column_name: str, column: "sqlalchemy.Column"
+    ) -> Tuple["sqlalchemy.sql.Label", ...]:
+
+    return (
+        func.avg(column).label(f"{column_name}_mean"),
+        func.stddev(column).label(f"{column_name}_stddev"),
+        func.percentile_cont(.25).within_group(column).label(f"{column_name}_quartile25"),
+        func.percentile_cont(.5).within_group(column).label(f"{column_name}_quartile50"),
+        func.percentile_cont(.75).within_group(column).label(f"{column_name}_quartile75"),
+        # the 100th percentile is the max, no sort needed
+        func.max(column).label(f"{column_name}_quartile100"),
+    )
+
+def _get_from_obj(
+        table_obj: "sqlalchemy.Table", sampled: bool
+    ) -> "sqlalchemy.sql.FromClause":
+
+    if not sampled:
+        return table_obj
+    # The percentage is bound at execution, one statement serves every size
+    return table_obj.tablesample(
+        func.system(bindparam("sample_percent", type_=Float))
+    )
+
+@functools.lru_cache(maxsize=256)
+def _get_count_statement(
+        table_obj: "sqlalchemy.Table", sampled: bool = False
+    ) -> "sqlalchemy.sql.Select":
+    return select([func.count().label("row_count")]).select_from(
+        _get_from_obj(table_obj, sampled)
+    )
+
+# Tables come from the reflection cache, so the same statement object is
+# reused across requests and its compiled SQL is served from _compiled_cache.
+@functools.lru_cache(maxsize=256)
+def _get_metrics_statement(
+        table_obj: "sqlalchemy.Table", 
+        numeric_columns: FrozenSet[str],
+        sampled: bool = False
+    ) -> "sqlalchemy.sql.Select":
+
+    from_obj = _get_from_obj(table_obj, sampled)
+    cols = from_obj.c
+
+    select_query = list(itertools.chain.from_iterable(
+        _get_column_metrics(column, cols[column])
+        for column in numeric_columns
+    ))
+    # row count is just another aggregate, fetch it in the same round trip.
+    # When sampled it counts the sample, get_table_metrics scales it up.
+    select_query.append(func.count().label("row_count"))
+
+    return select(select_query).select_from(from_obj)
+
 async def _get_table_metrics_wrapper(
         engine: "Engine", 
         table_obj: "sqlalchemy.Table", 
         numeric_columns: Set[str], 
-        table_name: str
+        sample_percent: Optional[float] = None
     ) -> Dict[str, Dict[str, float]]:
-    
-    cols_table = [
-        (
-            func.avg(getattr(table_obj.columns, column)).label(f"{column}_mean"),
-            func.stddev(getattr(table_obj.columns, column)).label(f"{column}_stddev"),
-            func.percentile_cont(.25).within_group(getattr(table_obj.columns, column)).label(f"{column}_quartile25"),
-            func.percentile_cont(.5).within_group(getattr(table_obj.columns, column)).label(f"{column}_quartile50"),         
-            func.percentile_cont(.75).within_group(getattr(table_obj.columns, column)).label(f"{column}_quartile75"),
-            func.percentile_cont(1).within_group(getattr(table_obj.columns, column)).label(f"{column}_quartile100"),
-        )
-        for column in numeric_columns
-    ]
+
+    sampled = sample_percent is not None
+    statement = _get_metrics_statement(
+        table_obj, frozenset(numeric_columns), sampled=sampled
+    )
 
     table_metrics = await get_table_metrics(
-        engine, cols_table, table_name
+        engine,
+        statement,
+        _get_count_statement(table_obj, sampled=sampled),
+        numeric_columns,
+        sample_percent,
     )
 
     return table_metrics
@@ -389,47 +689,43 @@ async def _get_all_metrics_diff(
         },
     }
 
+    # aggregate suffix -> the metrics_diff bucket its diffs go into
+    diff_targets = {
+        "mean": metrics_diff["mean_diff"],
+        "stddev": metrics_diff["stddev_diff"],
+        "quartile25": metrics_diff["quartiles_diff"]["25"],
+        "quartile50": metrics_diff["quartiles_diff"]["50"],
+        "quartile75": metrics_diff["quartiles_diff"]["75"],
+        "quartile100": metrics_diff["quartiles_diff"]["100"],
+        "IQR": metrics_diff["quartiles_diff"]["IQR"],
+    }
+
     for key, table_1_value in table_1_agg_metrics.items():
         
-        table_2_value = table_2_agg_metrics[key]
+        table_2_value = table_2_agg_metrics.get(key)
+        if table_2_value is None:
+            # table_2 had no value for this aggregate (e.g. it is empty)
+            continue
 
-        try:
-            diff_value_percent = round(
-                ((table_1_value - table_2_value) * 100) / table_1_value,
-                3
-            )
-        except ZeroDivisionError:
-            diff_value_percent = "N/A"
+        diff_value_raw = table_1_value - table_2_value
+        diff_value_raw_str = str(round(diff_value_raw, 5))
 
-        if diff_value_percent != "N/A":
+        if table_1_value:
+            diff_value_percent = round((diff_value_raw * 100) / table_1_value, 3)
             diff_value_percent_str = f"{diff_value_percent}%"
         else:
-            diff_value_percent_str = diff_value_percent
-
-        diff_value_raw = table_1_value - table_2_value
-        diff_value_raw_str = str(round(diff_value_raw, 5))
+            diff_value_percent_str = "N/A"
 
         diff_value = {
             "raw": diff_value_raw_str,
             "percent": diff_value_percent_str,
         }
 
-        column_name, sep, agg_operation=on = key.rpartition("_")  
-    
-        if agg_operation == "mean":
-            metrics_diff["mean_diff"][column_name] = diff_value
-        elif agg_operation == "stddev":
-            metrics_diff["stddev_diff"][column_name] = diff_value
-        elif agg_operation == "quartile25":
-            metrics_diff["quartiles_diff"]["25"][column_name] = diff_value
-        elif agg_operation == "quartile50":
-            metrics_diff["quartiles_diff"]["50"][column_name] = diff_value
-        elif agg_operation == "quartile75":
-            metrics_diff["quartiles_diff"]["75"][column_name] = diff_value
-        elif agg_operation == "quartile100":
-            metrics_diff["quartiles_diff"]["100"][column_name] = diff_value
-        elif agg_operation == "IQR":
-            metrics_diff["quartiles_diff"]["IQR"][column_name] = diff_value
+        column_name, sep, agg_operation = key.rpartition("_")
+
+        target = diff_targets.get(agg_operation)
+        if target is not None:
+            target[column_name] = diff_value
 
     return metrics_diff
 
@@ -496,21 +792,21 @@ async def get_summary_diff(
 
 
 # # get table diff
-@app.post("/api/getTableDiff/")
+@app.post("/api/getTableDiff/", dependencies=[Depends(verify_token)])
 async def get_table_diff(
         payload: DiffInput, 
         response: Response,
-        x_api_token: str = Header("")
     ):
-    
-    if x_api_token != API_TOKEN:
-        response.status_code = status.HTTP_401_UNAUTHORIZED
-        return {"error": "Authentication failure"}
 
     conn_1 = payload.conn_1
     conn_2 = payload.conn_2
     table_1 = payload.table_1
     table_2 = payload.table_2
+    sample_percent = payload.sample_percent
+
+    if sample_percent is not None and not 0 < sample_percent <= 100:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return {"error": "sample_percent must be greater than 0 and at most 100."}
 
     engine_1 = await connect_database(conn_1)
     if not engine_1:
@@ -522,17 +818,44 @@ async def get_table_diff(
         response.status_code = status.HTTP_400_BAD_REQUEST
         return {"error": f"Could not connect to DB with the provided connection string."}
 
-    if not await table_name_exists(engine_1, table_1):
+    if sample_percent is not None and (
+        engine_1.dialect.name != "postgresql" or engine_2.dialect.name != "postgresql"
+    ):
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return {"error": "sample_percent is only supported for PostgreSQL connections."}
+
+    table_1_exists, table_2_exists = await asyncio.gather(
+        table_name_exists(engine_1, table_1),
+        table_name_exists(engine_2, table_2),
+    )
+
+    if not table_1_exists:
         response.status_code = status.HTTP_400_BAD_REQUEST
         return {"error": f"Table name {table_1} does not exist"}
     
-    if not await table_name_exists(engine_2, table_2):
+    if not table_2_exists:
         response.status_code = status.HTTP_400_BAD_REQUEST
         return {"error": f"Table name {table_2} does not exist"}
 
-    table_1_obj, table_1_cols = await get_table_columns(engine_1, table_1)
-    table_2_obj, table_2_cols = await get_table_columns(engine_2, table_2)
+    if sample_percent is not None and not all(await asyncio.gather(
+        supports_tablesample(engine_1, table_1),
+        supports_tablesample(engine_2, table_2),
+    )):
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return {"error": "sample_percent is only supported for tables and materialized views."}
 
+    (table_1_obj, table_1_cols), (table_2_obj, table_2_cols) = await asyncio.gather(
+        get_table_columns(engine_1, table_1),
+        get_table_columns(engine_2, table_2),
+    )
+
+    if table_1_obj is None:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return {"error": f"Table name {table_1} does not exist"}
+
+    if table_2_obj is None:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return {"error": f"Table name {table_2} does not exist"}
 
     columns_data = await get_columns_data(table_1_cols, table_2_cols)
 
@@ -550,20 +873,22 @@ async def get_table_diff(
     )
     
     
-    table_1_metrics = await _get_table_metrics_wrapper(
-        engine=engine_1,
-        table_obj=table_1_obj,
-        numeric_columns=numeric_columns,
-        table_name=table_1
+    # Both aggregate queries are independent, run them concurrently
+    table_1_metrics, table_2_metrics = await asyncio.gather(
+        _get_table_metrics_wrapper(
+            engine=engine_1,
+            table_obj=table_1_obj,
+            numeric_columns=numeric_columns,
+            sample_percent=sample_percent
+        ),
+        _get_table_metrics_wrapper(
+            engine=engine_2,
+            table_obj=table_2_obj,
+            numeric_columns=numeric_columns,
+            sample_percent=sample_percent
+        ),
     )
     final_output["rows_data"]["table_1"] = table_1_metrics
-
-    table_2_metrics = await _get_table_metrics_wrapper(
-        engine=engine_2,
-        table_obj=table_2_obj,
-        numeric_columns=numeric_columns,
-        table_name=table_2
-    )
     final_output["rows_data"]["table_2"] = table_2_metrics
 
     table_1_agg_metrics = table_1_metrics.pop("original_metrics", {})
@@ -582,5 +907,12 @@ async def get_table_diff(
     final_output["diff_summary"] = await get_summary_diff(
         final_output, numeric_columns
     )
+
+    if sample_percent is not None:
+        final_output["warnings"] = [
+            f"Column metrics and row counts were estimated from a {sample_percent}% "
+            "sample of each table and are approximate."
+        ]
+
     return final_output
         
\ No newline at end of file